@@ -5,6 +5,7 @@ import boto3
 from pydantic import BaseModel
 import base64
 import json
+from recordHelper import instrument
 
 load_dotenv(".env")
 
@@ -66,7 +67,7 @@ def get_sts_credentials(authCode: str) -> any:
     """Obtain STS credentials for cross account calls to enterprises Q Index"""
     
 
-    sts =  isvSession.client('sts')
+    sts =  instrument(isvSession.client('sts'))
 
     assume_role_response = sts.assume_role(
         RoleArn=isvInformation.isv_role_arn,
@@ -83,7 +84,7 @@ def get_sts_credentials(authCode: str) -> any:
 
     # Create SSO OIDC client
 
-    sso_oidc = session.client('sso-oidc', region_name=enterpriseQIndex.idc_region)
+    sso_oidc = instrument(session.client('sso-oidc', region_name=enterpriseQIndex.idc_region))
     
     # Get token
     token_response = sso_oidc.create_token_with_iam(
@@ -96,7 +97,7 @@ def get_sts_credentials(authCode: str) -> any:
     # Extract and decode token
     payload = token_response['idToken'].split('.')[1]
     padding = '=' * (4 - len(payload) % 4)
-    identity_context = json.loads(base64.b64decode(payload + padding))
+    identity_context = json.loads(base64.urlsafe_b64decode(payload + padding))
     
     # Get STS identity context
     sts_context = identity_context.get('sts:identity_context')
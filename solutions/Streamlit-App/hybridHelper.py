@@ -0,0 +1,113 @@
+import re
+import time
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import numpy as np
+
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+# Module level so it survives Streamlit script reruns and can be used from background threads
+_retrievalExecutor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval")
+
+
+def _tokenize(text: str) -> list[str]:
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class LocalPassageIndex:
+    """BM25 index over fixed size passages of a local document, built once at start up"""
+
+    def __init__(self, lines: list[str], lines_per_passage: int = 10, k1: float = 1.2, b: float = 0.75):
+        self.passages = []
+        for start in range(0, len(lines), lines_per_passage):
+            passage = " ".join(line.strip() for line in lines[start:start + lines_per_passage]).strip()
+            if passage:
+                self.passages.append(passage)
+
+        self._vocabulary = {}
+        rows, cols = [], []
+        for row, passage in enumerate(self.passages):
+            for token in _tokenize(passage):
+                rows.append(row)
+                cols.append(self._vocabulary.setdefault(token, len(self._vocabulary)))
+
+        counts = np.zeros((len(self.passages), len(self._vocabulary)), dtype=np.float32)
+        np.add.at(counts, (rows, cols), 1.0)
+
+        lengths = counts.sum(axis=1, keepdims=True)
+        document_frequency = (counts > 0).sum(axis=0)
+        n = len(self.passages)
+        self._idf = np.log(1.0 + (n - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        # Term weights are query independent, so the whole BM25 saturation is precomputed here
+        norm = k1 * (1.0 - b + b * lengths / max(float(lengths.mean()), 1.0))
+        self._weights = counts * (k1 + 1.0) / (counts + norm)
+
+    def search(self, query: str, max_results: int = 5) -> list[dict]:
+        """Return the best matching passages shaped like SRC relevantContent entries"""
+        columns = [self._vocabulary[token] for token in set(_tokenize(query)) if token in self._vocabulary]
+        if not columns:
+            return []
+        scores = self._weights[:, columns] @ self._idf[columns]
+        ranked = np.argsort(-scores, kind='stable')[:max_results]
+        return [
+            {'content': self.passages[i], 'documentTitle': 'Local document', 'score': float(scores[i])}
+            for i in ranked if scores[i] > 0
+        ]
+
+
+@lru_cache(maxsize=4)
+def load_local_index(path: str) -> LocalPassageIndex:
+    """Build the passage index for a local document once per process"""
+    with open(path, 'r') as file:
+        return LocalPassageIndex(file.readlines())
+
+
+def reciprocal_rank_fusion(rankings: list[list[dict]], k: int = 60, max_results: int = 5) -> list[dict]:
+    """
+    Merge ranked chunk lists with reciprocal rank fusion.
+
+    Args:
+        rankings (list[list[dict]]): Ranked lists of chunks, each with a 'content' key
+        k (int): RRF damping constant
+        max_results (int): Number of fused chunks to return
+
+    Returns:
+        list[dict]: Chunks ordered by fused score, identical content merged
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking):
+            key = " ".join(chunk['content'].split())
+            score, first = fused.get(key, (0.0, chunk))
+            fused[key] = (score + 1.0 / (k + rank + 1), first)
+
+    ordered = sorted(fused.values(), key=lambda entry: entry[0], reverse=True)
+    return [chunk for _, chunk in ordered[:max_results]]
+
+
+def hybrid_retrieve(local_search, remote_search, deadline_seconds: float) -> tuple[list[dict], list[dict], bool]:
+    """
+    Start the remote search on a worker thread, run the local search meanwhile, then wait for
+    the remote result only until the deadline.
+
+    On a miss or failure a still queued remote search is cancelled, so a backlog of slow calls
+    cannot hold every later request behind it. A search that is already running keeps its
+    worker until the boto3 call returns.
+
+    Returns:
+        tuple: local chunks, remote chunks (empty if it missed the deadline or failed), whether remote made it
+    """
+    started = time.monotonic()
+    remote_future = _retrievalExecutor.submit(remote_search)
+    local_chunks = local_search()
+
+    remaining = max(deadline_seconds - (time.monotonic() - started), 0.0)
+    try:
+        return local_chunks, remote_future.result(timeout=remaining), True
+    except FutureTimeoutError:
+        print(f"Q index search missed the {deadline_seconds}s deadline, answering from local passages")
+    except Exception as e:
+        print(f"Q index search failed, answering from local passages: {str(e)}")
+    remote_future.cancel()
+    return local_chunks, [], False
@@ -6,37 +6,55 @@ from streamlit_pdf_viewer import pdf_viewer
 from urllib.parse import urlparse, parse_qs
 from authflowHelper import get_idp_idc_authorization_url, get_sts_credentials, getEnterpriseQIndex, STSCredentials
 from ttiflowHelper import getOIDCToken
+from rerankHelper import rerank_chunks
+from hybridHelper import load_local_index, reciprocal_rank_fusion, hybrid_retrieve
+from profileHelper import PROFILING_ENV_ENABLED, run_profiled
+from jobHelper import submit_job, raise_if_cancelled, JobCancelled
+from promptHelper import load_document_prompt, converse_cached
+from recordHelper import instrument
 import os
 
 
 bedrockModelId = os.environ.get('BEDROCK_MODEL')
 
+# Over-fetch from SRC so near-duplicates can be collapsed before picking the chunks sent to the model
+srcCandidateResults = int(os.environ.get('SRC_CANDIDATE_RESULTS', '25'))
+contextTopK = int(os.environ.get('CONTEXT_TOP_K', '5'))
+
+# RETRIEVAL_MODE=hybrid queries the local document and the Q index together once connected
+hybridRetrieval = os.environ.get('RETRIEVAL_MODE', '').lower() == 'hybrid'
+hybridDeadlineSeconds = float(os.environ.get('HYBRID_DEADLINE_SECONDS', '8'))
+
+# Profile requests when PROFILE_REQUESTS is set or the dashboard was opened with ?profile=1
+profilingEnabled = PROFILING_ENV_ENABLED or st.session_state.get('profiling', False)
+
 
 # If auth code in URL query string, fetch STS credentials for Q Index call
 
 if 'stsCredentials' not in st.session_state and 'code' in st.query_params:
-    st.session_state.stsCredentials = get_sts_credentials(st.query_params['code'])
+    if profilingEnabled:
+        st.session_state.stsCredentials = run_profiled("login-authcode", get_sts_credentials, st.query_params['code'])
+    else:
+        st.session_state.stsCredentials = get_sts_credentials(st.query_params['code'])
 
     #print("stsCredentials:", st.session_state.stCredentials)
 
 
 
-bedrock_client = boto3.client('bedrock-runtime', region_name=os.environ.get('BEDROCK_MODEL_REGION'))
-
-
-with open('SportsintheUnitedStates.txt', 'r') as file:
-    demoText = file.readlines()
+bedrock_client = instrument(boto3.client('bedrock-runtime', region_name=os.environ.get('BEDROCK_MODEL_REGION')))
 
 
 with open("SportsintheUnitedStates-1-10-Wikipedia.pdf", "rb") as file:
     pdf_data = file.read()
 
 
-
 SYSTEM_PROMPT = """
 You are a helpful AI assistant who answers question correctly and accurately. Do not makeup answers and only answer from the provided information in the prompt. Answer 'Do Not Know' if information not available in provided context.
 """
 
+# Static system prompt and document prefix, built on the first run and reused by every later rerun
+kbSystem, kbDocument = load_document_prompt('SportsintheUnitedStates.txt', SYSTEM_PROMPT)
+
 if 'chatHistory' not in st.session_state:
    st.session_state.setdefault("chatHistory", [{"chat":"How can I help you?", "is_user":False}])
    
@@ -45,13 +63,54 @@ if 'chatHistory' not in st.session_state:
 
 def on_input_change():
     user_input = st.session_state.user_input
-    chat_response = get_response(user_input)
+
+    # A newer question supersedes the one still being answered, a finished answer not yet polled is kept
+    previousJob = st.session_state.get('answerJob')
+    if previousJob is not None:
+        if previousJob.future.done():
+            collect_answer(previousJob)
+        else:
+            previousJob.cancel()
+            st.session_state.chatHistory.append({"chat":"Skipped, superseded by a newer question", "is_user":False})
+
+    # Session state is not available on the worker thread, so the credentials are read here
+    stsCred = st.session_state.get('stsCredentials')
+    if profilingEnabled:
+        st.session_state.answerJob = submit_job(user_input, run_profiled, "get_response", get_response, user_input, stsCred)
+    else:
+        st.session_state.answerJob = submit_job(user_input, get_response, user_input, stsCred)
+
     st.session_state.chatHistory.append({"chat":f"{user_input}", "is_user":True})
-    st.session_state.chatHistory.append({"chat":f"{chat_response}", "is_user":False})
     st.session_state.user_input = ''
 
 
 
+def collect_answer(job):
+    try:
+        chat_response = job.future.result()
+    except JobCancelled:
+        return
+    except Exception as e:
+        chat_response = f"Error generating answer: {str(e)}"
+    st.session_state.chatHistory.append({"chat":f"{chat_response}", "is_user":False})
+
+
+
+@st.fragment(run_every=0.5)
+def answer_progress():
+    job = st.session_state.get('answerJob')
+    if job is None:
+        return
+    if not job.future.done():
+        st.caption(f"Answering \"{job.user_input}\" ({job.elapsed():.0f}s)")
+        return
+
+    st.session_state.answerJob = None
+    collect_answer(job)
+    st.rerun()
+
+
+
 if 'stsCredentials' in st.session_state:
     st.set_page_config(
         page_title="ISV <-- Enterprise Index Retrieval Demo",
@@ -79,7 +138,10 @@ def signup_dialog():
 
 
 def startTTI_flow(userName: str, password: str):
-    st.session_state.stsCredentials = getOIDCToken(userName, password)
+    if profilingEnabled:
+        st.session_state.stsCredentials = run_profiled("login-tti", getOIDCToken, userName, password)
+    else:
+        st.session_state.stsCredentials = getOIDCToken(userName, password)
     st.rerun()
 
 
@@ -114,6 +176,9 @@ with col2:
     with chat_placeholder.container(): 
         for chat in st.session_state.chatHistory:
             message(chat["chat"], is_user=chat["is_user"], key=uuid.uuid4().hex)
+    # Only polls while an answer is in flight, the full rerun at completion stops it again
+    if st.session_state.get('answerJob') is not None:
+        answer_progress()
     with st.container():
         st.text_input("User Input:", on_change=on_input_change, key="user_input")
 
@@ -124,25 +189,25 @@ with col3:
 
 
 
-def get_response(user_input):
+def get_response(user_input, stsCred: STSCredentials = None):
     # check to see if we have Q Index connected
-    if 'stsCredentials' in st.session_state:
-        return get_response_from_q_index(user_input)
+    if stsCred is not None:
+        if hybridRetrieval:
+            return get_response_hybrid(user_input, stsCred)
+        return get_response_from_q_index(user_input, stsCred)
     else:
         return get_response_with_llm_kb(user_input)
 
 
 
-def get_response_from_q_index(user_input: str):
-    stsCred: STSCredentials = st.session_state.stsCredentials
-    # print(stsCred)
-    qbiz = boto3.client(
+def search_q_index(user_input: str, stsCred: STSCredentials) -> list[dict]:
+    qbiz = instrument(boto3.client(
         "qbusiness",
         aws_access_key_id=stsCred.aws_access_key_id,
         aws_secret_access_key=stsCred.aws_secret_access_key,
         aws_session_token=stsCred.aws_session_token,
         region_name=getEnterpriseQIndex().application_region
-        )
+        ))
     
 
 
@@ -153,49 +218,73 @@ def get_response_from_q_index(user_input: str):
             }
     }, 
     'queryText': f'{user_input}', 
-    'maxResults': 5
+    'maxResults': srcCandidateResults
     }
 
     search_response = qbiz.search_relevant_content(**search_params)
-    
-    full_context = ""
 
-    for chunks in search_response['relevantContent']:
-        full_context = full_context + chunks['content'] + "\n"
+    return rerank_chunks(search_response['relevantContent'], top_k=contextTopK)
 
-    SYSTEM_PROMPT=""""
-    You are a helpful AI assistant who answers question correctly and accurately about a AcmeCompany's IT tickets. Do not makeup answers and only answer from the provided knowledge.
-    """
+
+
+def converse_with_context(chunks: list[dict], user_input: str, system_prompt: str):
+    full_context = ""
+
+    for chunk in chunks:
+        full_context = full_context + chunk['content'] + "\n"
 
     messages = [{"role": "user","content":[{"text": f"Given the full context: {full_context}\n\nAnswer this question accurately: {user_input}"}]}]
 
     converse_params = {
             "modelId": bedrockModelId,
             "messages": messages,                
-            "system": [{"text": SYSTEM_PROMPT}]
+            "system": [{"text": system_prompt}]
         }
 
+    raise_if_cancelled()
     ai_response = bedrock_client.converse(**converse_params)
 
     return(ai_response['output']['message']['content'][0]['text'])
 
 
 
-def get_response_with_llm_kb(user_input):
-    chatPrompt = f"""
-    <document>
-    {demoText}
-    </document>
+def get_response_from_q_index(user_input: str, stsCred: STSCredentials):
+    # print(stsCred)
 
-    {user_input}
+    SYSTEM_PROMPT=""""
+    You are a helpful AI assistant who answers question correctly and accurately about a AcmeCompany's IT tickets. Do not makeup answers and only answer from the provided knowledge.
     """
 
+    return converse_with_context(search_q_index(user_input, stsCred), user_input, SYSTEM_PROMPT)
+
+
 
+def get_response_hybrid(user_input: str, stsCred: STSCredentials):
+    # SRC goes out on a worker thread while the local passages are scored on this one
+    local_chunks, remote_chunks, _ = hybrid_retrieve(
+        lambda: load_local_index('SportsintheUnitedStates.txt').search(user_input, max_results=contextTopK),
+        lambda: search_q_index(user_input, stsCred),
+        hybridDeadlineSeconds
+    )
+
+    fused_chunks = reciprocal_rank_fusion([remote_chunks, local_chunks], max_results=contextTopK)
+
+    SYSTEM_PROMPT=""""
+    You are a helpful AI assistant who answers question correctly and accurately. The context combines passages from the enterprise Q index and a local document. Do not makeup answers and only answer from the provided knowledge.
+    """
+
+    return converse_with_context(fused_chunks, user_input, SYSTEM_PROMPT)
+
+
+
+def get_response_with_llm_kb(user_input):
+    # The document stays ahead of the question so the cached prefix is identical on every call
     messages = [
         {
             "role": "user",
             "content":[
-                {"text": chatPrompt}
+                *kbDocument,
+                {"text": user_input}
             ]
         }
     ]
@@ -204,10 +293,10 @@ def get_response_with_llm_kb(user_input):
     converse_params = {
         "modelId": bedrockModelId,
         "messages": messages,                
-        "system": [{"text": SYSTEM_PROMPT}]
+        "system": kbSystem
     }       
     
-    ai_response = bedrock_client.converse(**converse_params)
+    raise_if_cancelled()
+    ai_response = converse_cached(bedrock_client, converse_params)
 
     return ai_response['output']['message']['content'][0]['text']
-
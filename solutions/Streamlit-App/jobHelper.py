@@ -0,0 +1,60 @@
+import time
+import itertools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Module level so it survives Streamlit script reruns, which re-execute index.py but not imported modules
+_answerExecutor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="answer")
+_currentJob = contextvars.ContextVar('currentJob', default=None)
+_jobIds = itertools.count(1)
+
+
+class JobCancelled(Exception):
+    """Raised inside a background job once a newer question has superseded it"""
+
+
+class AnswerJob:
+    """Handle on an answer that is being generated in the background for one session"""
+
+    def __init__(self, user_input: str):
+        self.job_id = next(_jobIds)
+        self.user_input = user_input
+        self.started = time.monotonic()
+        self.future = None
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def cancel(self):
+        """Drop a queued job outright, or flag a running one so it stops at its next checkpoint"""
+        self._cancelled.set()
+        self.future.cancel()
+
+
+def submit_job(user_input: str, fn, *args, **kwargs) -> AnswerJob:
+    job = AnswerJob(user_input)
+    job.future = _answerExecutor.submit(_run_job, job, fn, args, kwargs)
+    return job
+
+
+def _run_job(job: AnswerJob, fn, args: tuple, kwargs: dict):
+    token = _currentJob.set(job)
+    try:
+        raise_if_cancelled()
+        return fn(*args, **kwargs)
+    finally:
+        _currentJob.reset(token)
+
+
+def raise_if_cancelled():
+    """Checkpoint for long running steps, a no-op outside of a background job"""
+    job = _currentJob.get()
+    if job is not None and job.cancelled:
+        raise JobCancelled(f"Job {job.job_id} was superseded by a newer question")
@@ -2,9 +2,15 @@ import os
 import streamlit as st
 import pandas as pd
 from validateHelper import validate_AccessKey_Credentials, validate_role_arn, ping_url
+from profileHelper import PROFILING_ENV_ENABLED, list_profiles, top_functions
 
 
 
+# ?profile=1 / ?profile=0 switches request profiling on or off for this session
+if 'profile' in st.query_params:
+    st.session_state.profiling = st.query_params['profile'].lower() in ('1', 'true', 'on')
+
+
 # Define custom CSS
 st.markdown("""
     <style>
@@ -108,5 +114,19 @@ if st.button("Run Tests", type="primary"):
 
 
 
+if PROFILING_ENV_ENABLED or st.session_state.get('profiling', False):
+    st.markdown("### Request Profiles")
+    profiles = list_profiles()
+    if len(profiles) == 0:
+        st.info("Profiling is on. Ask a question or log in on the index page to record a profile.")
+    else:
+        selectedProfile = st.selectbox("Profile", profiles, format_func=os.path.basename)
+        sortBy = st.radio("Sort by", ["cumulative", "tottime"], horizontal=True)
+        st.table(pd.DataFrame(top_functions(selectedProfile, top_n=25, sort_by=sortBy)))
 
-
+        foldedProfile = selectedProfile[:-len('.prof')] + '.folded'
+        with open(selectedProfile, 'rb') as file:
+            st.download_button("Download pstats (.prof)", file.read(), file_name=os.path.basename(selectedProfile))
+        if os.path.exists(foldedProfile):
+            with open(foldedProfile, 'rb') as file:
+                st.download_button("Download flamegraph stacks (.folded)", file.read(), file_name=os.path.basename(foldedProfile))
@@ -28,6 +28,13 @@ found in IAM IDC.
 The dashboard page has a short set of tests that verify your Sig V4 connection to the ISV AWS account, it can verify that the appropriate role is specified with the
 correct permissions. Navigate to Dashboard and click on Run Tests.
 
+To find out where the time goes on a slow question or login, open the dashboard with ```?profile=1``` (or set ```PROFILE_REQUESTS=1```
+before starting the application). Each answer or login is then run under cProfile and saved to ```PROFILE_DIR``` (default .profiles).
+The dashboard shows a top-N table for every saved profile and offers the pstats dump, which opens in snakeviz, and a folded stack
+file, which opens in speedscope or flamegraph.pl. Use ```?profile=0``` to switch it off again.
+Only the answering thread is profiled. With ```RETRIEVAL_MODE=hybrid``` the Q index search and reranking run on a retrieval
+worker, so the profile shows the time spent waiting for them rather than their own calls.
+
 Before you can use this applcation, verify that all the correct information has been entered into the local .env file.
 ```
 # ISV API Access Keys
@@ -0,0 +1,120 @@
+import os
+import cProfile
+import pstats
+import time
+
+
+# PROFILE_REQUESTS=1 profiles every request, the dashboard can also switch it on per session with ?profile=1
+PROFILING_ENV_ENABLED = os.environ.get('PROFILE_REQUESTS', '').lower() in ('1', 'true', 'on')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '.profiles')
+
+
+def run_profiled(name: str, fn, *args, **kwargs):
+    """
+    Run fn under cProfile and save the profile for the dashboard.
+
+    Two files are written to PROFILE_DIR: a pstats dump (snakeviz, flameprof, pstats) and a
+    folded stack file that flamegraph.pl and speedscope read directly.
+    """
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # Only one profiler can be active at a time, run unprofiled rather than fail the request
+        print(f"Skipping profile for {name}: {str(e)}")
+        return fn(*args, **kwargs)
+
+    started = time.time()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profiler.disable()
+        try:
+            save_profile(name, profiler, time.time() - started)
+        except Exception as e:
+            print(f"Error saving profile for {name}: {str(e)}")
+
+
+def save_profile(name: str, profiler: cProfile.Profile, duration_seconds: float) -> str:
+    """Write the pstats dump and folded stacks, returning the path of the pstats dump"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base_path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{int(duration_seconds * 1000)}ms-{name}")
+
+    stats = pstats.Stats(profiler)
+    stats.dump_stats(base_path + '.prof')
+    with open(base_path + '.folded', 'w') as file:
+        for stack, microseconds in folded_stacks(stats).items():
+            file.write(f"{stack} {microseconds}\n")
+
+    print(f"Saved profile {base_path}.prof ({duration_seconds:.3f}s)")
+    return base_path + '.prof'
+
+
+def _label(func: tuple) -> str:
+    filename, line, funcname = func
+    if filename == '~':
+        return funcname.replace(';', ',')
+    return f"{funcname} ({os.path.basename(filename)}:{line})".replace(';', ',')
+
+
+def folded_stacks(stats: pstats.Stats, max_depth: int = 64, min_seconds: float = 0.00005) -> dict[str, int]:
+    """
+    Rebuild folded stacks from the cProfile caller graph.
+
+    cProfile only records caller -> callee edges, so each callee's self time is split across
+    the stacks that reach it in proportion to the time spent on each incoming edge. Branches
+    worth less than min_seconds are pruned to keep the walk bounded on large call graphs.
+    """
+    entries = stats.stats
+    callees = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, (_, _, _, edge_cumulative) in callers.items():
+            callees.setdefault(caller, []).append((func, edge_cumulative))
+
+    folded = {}
+
+    def walk(func: tuple, stack: list[str], on_stack: set, share: float):
+        # share is the fraction of func's total time that was spent under this particular stack
+        _, _, self_time, _, _ = entries[func]
+        stack.append(_label(func))
+        microseconds = int(self_time * share * 1_000_000)
+        if microseconds > 0:
+            key = ';'.join(stack)
+            folded[key] = folded.get(key, 0) + microseconds
+        if len(stack) < max_depth:
+            on_stack.add(func)
+            for callee, edge_cumulative in callees.get(func, []):
+                callee_cumulative = entries[callee][3]
+                if callee not in on_stack and share * edge_cumulative >= min_seconds:
+                    walk(callee, stack, on_stack, share * min(edge_cumulative / callee_cumulative, 1.0))
+            on_stack.discard(func)
+        stack.pop()
+
+    for func, (_, _, _, _, callers) in entries.items():
+        if not callers:
+            walk(func, [], set(), 1.0)
+    return folded
+
+
+def list_profiles(limit: int = 10) -> list[str]:
+    """Most recent pstats dumps in PROFILE_DIR, newest first"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    paths = [os.path.join(PROFILE_DIR, f) for f in os.listdir(PROFILE_DIR) if f.endswith('.prof')]
+    return sorted(paths, key=os.path.getmtime, reverse=True)[:limit]
+
+
+def top_functions(stats_path: str, top_n: int = 25, sort_by: str = 'cumulative') -> list[dict]:
+    """Top-N summary rows of a pstats dump, sorted by cumulative or self time"""
+    stats = pstats.Stats(stats_path)
+    stats.sort_stats(sort_by)
+    rows = []
+    for func in stats.fcn_list[:top_n]:
+        primitive_calls, total_calls, self_time, cumulative, _ = stats.stats[func]
+        rows.append({
+            "Function": _label(func),
+            "Calls": total_calls if total_calls == primitive_calls else f"{total_calls}/{primitive_calls}",
+            "Self (ms)": round(self_time * 1000, 2),
+            "Cumulative (ms)": round(cumulative * 1000, 2)
+        })
+    return rows
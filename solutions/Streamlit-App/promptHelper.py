@@ -0,0 +1,78 @@
+import os
+from functools import lru_cache
+from botocore.exceptions import ClientError
+
+
+CACHE_POINT = {"cachePoint": {"type": "default"}}
+
+# Set BEDROCK_PROMPT_CACHING=false for models without Converse prompt caching support
+_promptCaching = {"enabled": os.environ.get('BEDROCK_PROMPT_CACHING', 'true').lower() not in ('0', 'false', 'off')}
+
+
+@lru_cache(maxsize=4)
+def load_document_prompt(path: str, system_prompt: str) -> tuple[list, list]:
+    """
+    Build the static system and document blocks for a local document once per process.
+
+    The document ends in a cache point covering both it and the system prompt, so Bedrock can reuse
+    the processed prefix across questions and only the question itself is new input on a cache hit.
+    The system prompt alone is below the minimum cacheable size, so it gets no cache point of its own.
+
+    Returns:
+        tuple: system blocks, document content blocks to place ahead of the question
+    """
+    with open(path, 'r') as file:
+        document = file.read()
+
+    system = [{"text": system_prompt}]
+    document_blocks = [{"text": f"<document>\n{document}\n</document>"}, CACHE_POINT]
+    return system, document_blocks
+
+
+def _without_cache_points(blocks: list) -> list:
+    return [block for block in blocks if "cachePoint" not in block]
+
+
+def _strip_cache_points(converse_params: dict) -> dict:
+    return {
+        **converse_params,
+        "system": _without_cache_points(converse_params.get("system", [])),
+        "messages": [
+            {**message, "content": _without_cache_points(message["content"])}
+            for message in converse_params["messages"]
+        ]
+    }
+
+
+def converse_cached(bedrock_client, converse_params: dict) -> dict:
+    """Call Converse with cache points, dropping them for good if the model rejects them"""
+    if not _promptCaching["enabled"]:
+        ai_response = bedrock_client.converse(**_strip_cache_points(converse_params))
+    else:
+        try:
+            ai_response = bedrock_client.converse(**converse_params)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ValidationException':
+                raise
+            ai_response = bedrock_client.converse(**_strip_cache_points(converse_params))
+            print(f"Prompt caching rejected by {converse_params['modelId']}, continuing without it: {str(e)}")
+            _promptCaching["enabled"] = False
+
+    report_cache_usage(ai_response)
+    return ai_response
+
+
+def report_cache_usage(ai_response: dict) -> dict:
+    """Log cache read versus cache write tokens from a Converse response"""
+    usage = ai_response.get('usage', {})
+    cacheUsage = {
+        "inputTokens": usage.get('inputTokens', 0),
+        "cacheReadInputTokens": usage.get('cacheReadInputTokens', 0),
+        "cacheWriteInputTokens": usage.get('cacheWriteInputTokens', 0),
+        "outputTokens": usage.get('outputTokens', 0)
+    }
+    print(
+        f"Bedrock usage: input={cacheUsage['inputTokens']} cache read={cacheUsage['cacheReadInputTokens']} "
+        f"cache write={cacheUsage['cacheWriteInputTokens']} output={cacheUsage['outputTokens']}"
+    )
+    return cacheUsage
@@ -0,0 +1,272 @@
+import os
+import re
+import sys
+import json
+import gzip
+import time
+import zlib
+import atexit
+import base64
+import hashlib
+import threading
+from datetime import datetime
+from botocore.awsrequest import AWSResponse
+
+
+# TRAFFIC_RECORD_FILE records every instrumented boto3 call, TRAFFIC_REPLAY_FILE serves them back offline.
+# TRAFFIC_REPLAY_LATENCY_SCALE multiplies each call's recorded latency: 1.0 is original timing, 0 is as fast as possible.
+RECORD_FILE = os.environ.get('TRAFFIC_RECORD_FILE', '')
+REPLAY_FILE = os.environ.get('TRAFFIC_REPLAY_FILE', '')
+REPLAY_LATENCY_SCALE = float(os.environ.get('TRAFFIC_REPLAY_LATENCY_SCALE', '1.0'))
+
+REDACTED = '<redacted>'
+_SECRET_KEYS = re.compile(r'password|secret|token|assertion|accesskeyid', re.IGNORECASE)
+# Matched exactly, so error responses keep their 'Code'
+_SECRET_NAMES = {'code', 'codeVerifier', 'identityContext'}
+_UNSIGNED_JWT_HEADER = base64.urlsafe_b64encode(b'{"alg":"none"}').decode('utf-8').rstrip('=')
+# Every JWT header is a base64url JSON object, which always encodes to a leading 'eyJ'
+_JWT = re.compile(r'^eyJ[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]*$')
+
+
+def _decode_segment(segment: str):
+    return json.loads(base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4)))
+
+
+def _is_jwt(value: str) -> bool:
+    """Only a header that decodes to a JSON object with an alg makes a JWT, not a dotted name that looks like one"""
+    if not _JWT.match(value):
+        return False
+    try:
+        header = _decode_segment(value.split('.')[0])
+    except ValueError:
+        return False
+    return isinstance(header, dict) and 'alg' in header
+
+
+def _redact_jwt(token: str) -> str:
+    """
+    Keep a decodable JWT with every claim value blanked, so code that reads claims still runs on replay.
+    The payload is base64url like any JWT, and redacting an already redacted token returns it unchanged.
+    """
+    try:
+        claims = _decode_segment(token.split('.')[1])
+    except ValueError:
+        return REDACTED
+    if not isinstance(claims, dict):
+        return REDACTED
+    blanked = json.dumps({claim: REDACTED for claim in claims}, sort_keys=True)
+    encoded = base64.urlsafe_b64encode(blanked.encode('utf-8')).decode('utf-8').rstrip('=')
+    return f"{_UNSIGNED_JWT_HEADER}.{encoded}.redacted"
+
+
+def redact(value, key: str = ''):
+    """Replace secrets and tokens anywhere in a request or response"""
+    if isinstance(value, dict):
+        return {k: redact(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact(v, key) for v in value]
+    if isinstance(value, str):
+        if _is_jwt(value):
+            return _redact_jwt(value)
+        if key in _SECRET_NAMES or _SECRET_KEYS.search(key):
+            return REDACTED
+    return value
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, (bytes, bytearray)):
+        return {'__bytes__': base64.b64encode(value).decode('utf-8')}
+    return repr(value)
+
+
+def _decode(value: dict):
+    if '__datetime__' in value:
+        return datetime.fromisoformat(value['__datetime__'])
+    if '__bytes__' in value:
+        return base64.b64decode(value['__bytes__'])
+    return value
+
+
+def _request_key(service: str, operation: str, params: dict) -> str:
+    body = json.dumps(params, sort_keys=True, default=_encode, separators=(',', ':'))
+    return f"{service}.{operation}.{hashlib.sha256(body.encode('utf-8')).hexdigest()[:16]}"
+
+
+class TrafficRecorder:
+    """Appends redacted request/response pairs with timings to a gzip compressed JSON lines file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # Each process appends its own gzip member, readers see the members as one stream
+        self._file = gzip.open(path, 'at', encoding='utf-8')
+        atexit.register(self._file.close)
+        self._started = time.time()
+        print(f"Recording boto3 traffic to {path}")
+
+    def before_parameter_build(self, params, context, **kwargs):
+        context['_recorder'] = {'params': redact(params), 'started': time.monotonic()}
+
+    def after_call(self, http_response, parsed, model, context, **kwargs):
+        request = context.get('_recorder')
+        if request is None:
+            return
+        parsed = {k: v for k, v in parsed.items() if k != 'ResponseMetadata'}
+        record = {
+            'service': model.service_model.service_name,
+            'operation': model.name,
+            # Offset from the start of the recording, for analysis only, replay does not reproduce the gaps between calls
+            'offset': round(time.time() - self._started, 4),
+            'duration': round(time.monotonic() - request['started'], 4),
+            'status': http_response.status_code,
+            'request': request['params'],
+            'response': redact(parsed)
+        }
+        line = json.dumps(record, default=_encode, separators=(',', ':'))
+        with self._lock:
+            self._file.write(line + '\n')
+            # Sync flush so the file stays readable up to the last call even if the process is killed
+            self._file.flush()
+
+
+def read_recordings(path: str) -> list[dict]:
+    """Load every record, tolerating a truncated final gzip member from an interrupted recording"""
+    records = []
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        try:
+            for line in file:
+                records.append(json.loads(line, object_hook=_decode))
+        except (EOFError, gzip.BadGzipFile, zlib.error):
+            print(f"Recording {path} ends in an incomplete block, loaded the first {len(records)} records")
+    return records
+
+
+class TrafficReplayer:
+    """Serves recorded responses instead of calling AWS, matching on the redacted request first"""
+
+    def __init__(self, path: str, latency_scale: float = 1.0):
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._exact = {}
+        self._byOperation = {}
+        for record in read_recordings(path):
+            self._exact.setdefault(_request_key(record['service'], record['operation'], record['request']), []).append(record)
+            self._byOperation.setdefault(f"{record['service']}.{record['operation']}", []).append(record)
+        print(f"Replaying {sum(len(r) for r in self._byOperation.values())} recorded boto3 calls from {path}")
+
+    def _next(self, service: str, operation: str, params: dict) -> dict:
+        # Identical requests replay in recorded order, anything else falls back to the same operation round robin
+        with self._lock:
+            exact = self._exact.get(_request_key(service, operation, params))
+            if exact:
+                record = exact.pop(0)
+                exact.append(record)
+                return record
+            candidates = self._byOperation.get(f"{service}.{operation}")
+            if not candidates:
+                raise KeyError(f"No recording for {service}.{operation}")
+            record = candidates.pop(0)
+            candidates.append(record)
+            return record
+
+    def before_parameter_build(self, params, context, **kwargs):
+        context['_replay_params'] = redact(params)
+
+    def before_call(self, model, context, **kwargs):
+        record = self._next(model.service_model.service_name, model.name, context.get('_replay_params', {}))
+        if self.latency_scale > 0:
+            time.sleep(record['duration'] * self.latency_scale)
+        http_response = AWSResponse(url='', status_code=record['status'], headers={}, raw=None)
+        return http_response, record['response']
+
+
+_recorder = TrafficRecorder(RECORD_FILE) if RECORD_FILE else None
+_replayer = TrafficReplayer(REPLAY_FILE, REPLAY_LATENCY_SCALE) if REPLAY_FILE else None
+
+
+def instrument(client, recorder: TrafficRecorder = None, replayer: TrafficReplayer = None):
+    """Attach the recorder or replayer to a boto3 client, returns the client unchanged when neither is enabled"""
+    recorder = recorder or _recorder
+    replayer = replayer or _replayer
+    if replayer is not None:
+        client.meta.events.register('before-parameter-build.*.*', replayer.before_parameter_build)
+        client.meta.events.register('before-call.*.*', replayer.before_call)
+    elif recorder is not None:
+        client.meta.events.register('before-parameter-build.*.*', recorder.before_parameter_build)
+        client.meta.events.register('after-call.*.*', recorder.after_call)
+    return client
+
+
+def _self_check():
+    """Record the TTI token exchange against stubbed AWS responses, then replay it offline through the same code"""
+    import tempfile
+    import botocore.session
+    from botocore.stub import Stubber
+    from ttiflowHelper import exchange_isv_token
+
+    for key in ('IDC_APPLICATION_ARN', 'ISV_ROLE_ARN', 'ISV_TENANT_ID'):
+        os.environ.setdefault(key, 'arn:aws:iam::123456789012:role/self-check')
+
+    def claims_token(claims: dict) -> str:
+        encoded = base64.urlsafe_b64encode(json.dumps(claims).encode('utf-8')).decode('utf-8').rstrip('=')
+        return f"eyJhbGciOiJSUzI1NiJ9.{encoded}.c2lnbmF0dXJl"
+
+    def new_clients(attach):
+        session = botocore.session.get_session()
+        clients = [
+            session.create_client(service, region_name='us-east-1', aws_access_key_id='x', aws_secret_access_key='y')
+            for service in ('sts', 'sso-oidc')
+        ]
+        return [attach(client) for client in clients]
+
+    isvToken = claims_token({'sub': 'user-1', 'email': 'user@example.com'})
+    idToken = claims_token({'sts:identity_context': 'real-identity-context', 'aud': 'ab>?~c'})
+    # Dotted values that are not tokens must come through untouched, or recordings stop looking like production
+    for name in ('Quarterly_Report.Final_v2.pdf', 'eyJhbGciOi.not_a_token.pdf', 'api.example.com'):
+        assert redact({'documentTitle': name}) == {'documentTitle': name}, name
+
+    secrets = ('SECRET-ACCESS-KEY', 'SESSION-TOKEN', 'real-identity-context', 'user@example.com', 'refresh-token')
+
+    path = os.path.join(tempfile.mkdtemp(), 'self-check.jsonl.gz')
+    recorder = TrafficRecorder(path)
+    sts, sso_oidc = new_clients(lambda client: instrument(client, recorder=recorder))
+    with Stubber(sts) as stsStub, Stubber(sso_oidc) as oidcStub:
+        oidcStub.add_response('create_token_with_iam', {'idToken': idToken, 'accessToken': 'access-token', 'refreshToken': 'refresh-token'})
+        stsStub.add_response('assume_role', {'Credentials': {
+            'AccessKeyId': 'ASIAEXAMPLEEXAMPLE12', 'SecretAccessKey': 'SECRET-ACCESS-KEY',
+            'SessionToken': 'SESSION-TOKEN', 'Expiration': datetime(2030, 1, 1)
+        }})
+        recorded = exchange_isv_token(sts, sso_oidc, isvToken)
+    recorder._file.close()
+
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        stored = file.read()
+    leaked = [secret for secret in secrets if secret in stored]
+    assert not leaked, f"Recording contains secrets: {leaked}"
+
+    replayer = TrafficReplayer(path, latency_scale=0)
+    sts, sso_oidc = new_clients(lambda client: instrument(client, replayer=replayer))
+    replayed = exchange_isv_token(sts, sso_oidc, isvToken)
+    assert replayed.expiration == recorded.expiration
+    assert replayed.aws_session_token == REDACTED
+    print("Record and replay self-check passed")
+
+
+if __name__ == "__main__" and sys.argv[1:] == ['--self-check']:
+    _self_check()
+elif __name__ == "__main__":
+    # Summarise a recording: python recordHelper.py traffic.jsonl.gz
+    stats = {}
+    for record in read_recordings(sys.argv[1]):
+        size = len(json.dumps(record['response'], default=_encode))
+        stats.setdefault(f"{record['service']}.{record['operation']}", []).append((record['duration'], size))
+
+    print(f"{'operation':<45}{'calls':>7}{'p50 ms':>10}{'p95 ms':>10}{'avg bytes':>12}")
+    for operation, samples in sorted(stats.items()):
+        durations = sorted(duration for duration, _ in samples)
+        p50 = durations[len(durations) // 2] * 1000
+        p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))] * 1000
+        avgBytes = sum(size for _, size in samples) // len(samples)
+        print(f"{operation:<45}{len(samples):>7}{p50:>10.1f}{p95:>10.1f}{avgBytes:>12}")
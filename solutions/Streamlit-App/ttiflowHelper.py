@@ -6,7 +6,13 @@ import hmac
 import hashlib
 import json
 import base64
+import time
+import threading
+from datetime import datetime
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import BaseModel
+from recordHelper import instrument
 
 
 load_dotenv(".env")
@@ -16,6 +22,13 @@ class STSCredentials(BaseModel):
     aws_access_key_id: str
     aws_secret_access_key: str
     aws_session_token: str
+    expiration: Optional[datetime] = None
+
+class BatchCredentialResult(BaseModel):
+    """Outcome of minting credentials for one user in a batch"""
+    user: str
+    credentials: Optional[STSCredentials] = None
+    error: Optional[str] = None
 
 ## -- load access key and secret key for ISV account.
 isvSession = boto3.Session(
@@ -36,8 +49,21 @@ def getOIDCToken(userName: str, password: str) -> any:
     oidcToken = get_isv_token(pool_id, app_client_id, app_client_secret, userName, password)
 
 
-    sts =  isvSession.client('sts')
+    sts =  instrument(isvSession.client('sts'))
+
+    # Create SSO OIDC client from a token session with assumed credentials
+    sso_oidc = instrument(assume_base_role(sts).client('sso-oidc', region_name=os.environ.get('IDC_REGION')))
+
+    stsCredentials = exchange_isv_token(sts, sso_oidc, oidcToken)
+
+    #print(f"Received STS credentials = {stsCredentials}")
+
+    return stsCredentials
+
+
 
+def assume_base_role(sts) -> boto3.Session:
+    """Assume the ISV role without identity context, the session used to call IDC"""
     assume_role_response = sts.assume_role(
         RoleArn=os.environ.get('ISV_ROLE_ARN'),
         RoleSessionName='automated-session',
@@ -46,14 +72,18 @@ def getOIDCToken(userName: str, password: str) -> any:
 
 
     # Create token session with assumed credentials
-    session = boto3.Session(
+    return boto3.Session(
         aws_access_key_id=assume_role_response['Credentials']['AccessKeyId'],
         aws_secret_access_key=assume_role_response['Credentials']['SecretAccessKey'],
         aws_session_token=assume_role_response['Credentials']['SessionToken']
     )
 
-    # Create SSO OIDC client
-    sso_oidc = session.client('sso-oidc', region_name=os.environ.get('IDC_REGION'))
+
+
+def exchange_isv_token(sts, sso_oidc, oidcToken: str, rateLimiter=None) -> STSCredentials:
+    """Exchange an ISV (Cognito) token for IDC identity context, then for identity aware STS credentials"""
+    if rateLimiter is not None:
+        rateLimiter.acquire()
 
     # Get token
     token_response = sso_oidc.create_token_with_iam(
@@ -66,7 +96,7 @@ def getOIDCToken(userName: str, password: str) -> any:
     
     payload = token_response['idToken'].split('.')[1]
     padding = '=' * (4 - len(payload) % 4)
-    identity_context = json.loads(base64.b64decode(payload + padding))
+    identity_context = json.loads(base64.urlsafe_b64decode(payload + padding))
     
     # Get STS identity context
     sts_context = identity_context.get('sts:identity_context')
@@ -75,6 +105,9 @@ def getOIDCToken(userName: str, password: str) -> any:
         'ContextAssertion': sts_context
     }]                                    
 
+    if rateLimiter is not None:
+        rateLimiter.acquire()
+
     assume_role_response = sts.assume_role(
         RoleArn=os.environ.get('ISV_ROLE_ARN'),
         RoleSessionName='automated-session',
@@ -84,19 +117,84 @@ def getOIDCToken(userName: str, password: str) -> any:
 
 
 
-    stsCredentials = STSCredentials(
+    return STSCredentials(
         aws_access_key_id = str(assume_role_response['Credentials']['AccessKeyId']),
         aws_secret_access_key = str(assume_role_response['Credentials']['SecretAccessKey']),
-        aws_session_token=assume_role_response['Credentials']['SessionToken']
+        aws_session_token=assume_role_response['Credentials']['SessionToken'],
+        expiration=assume_role_response['Credentials']['Expiration']
     )
 
-    #print(f"Received STS credentials = {stsCredentials}")
 
-    return stsCredentials
+
+class RateLimiter:
+    """Thread safe limiter that spaces calls at most maxCallsPerSecond apart"""
+
+    def __init__(self, maxCallsPerSecond: float):
+        self._interval = 1.0 / maxCallsPerSecond
+        self._nextCall = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._nextCall - now
+            self._nextCall = max(now, self._nextCall) + self._interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+
+def getOIDCTokens(users: list[tuple[str, str]] = None, isvTokens: dict[str, str] = None, maxConcurrency: int = 8, maxCallsPerSecond: float = 20.0) -> list[BatchCredentialResult]:
+    """
+    Mint Q index credentials for many TTI users concurrently, for offline jobs.
+
+    The base role is assumed once and its IDC client shared by every worker. Each user then
+    costs a Cognito login (unless a pre-issued ISV token is given), an IDC token exchange and
+    one STS call, all paced by a shared rate limit.
+
+    Args:
+        users (list[tuple[str, str]]): (user name, password) pairs to log in through Cognito
+        isvTokens (dict[str, str]): Pre-issued ISV tokens keyed by user name
+        maxConcurrency (int): Number of users processed at the same time
+        maxCallsPerSecond (float): Limit on AWS API calls per second across all workers
+
+    Returns:
+        list[BatchCredentialResult]: One result per user, credentials or error, in input order
+    """
+    users = users or []
+    isvTokens = isvTokens or {}
+    print(f"Minting credentials for {len(users) + len(isvTokens)} users")
+
+    pool_id=os.environ.get('ISV_COGNITO_USER_POOL_ID')
+    app_client_id=os.environ.get('ISV_COGNITO_CLIENT_ID')
+    app_client_secret=os.environ.get('ISV_COGNITO_CLIENT_SECRET')
+
+    # boto3 clients are thread safe, sessions are not, so every client is created up front
+    rateLimiter = RateLimiter(maxCallsPerSecond)
+    sts = instrument(isvSession.client('sts'))
+    rateLimiter.acquire()
+    sso_oidc = instrument(assume_base_role(sts).client('sso-oidc', region_name=os.environ.get('IDC_REGION')))
+    cognito = instrument(boto3.client('cognito-idp', region_name=os.environ.get('ISV_COGNITO_REGION'))) if users else None
+
+    def mint(userName: str, password: str = None, isvToken: str = None) -> BatchCredentialResult:
+        try:
+            if isvToken is None:
+                rateLimiter.acquire()
+                # Quiet so a nightly batch does not write every user's bearer token to the job log
+                isvToken = get_isv_token(pool_id, app_client_id, app_client_secret, userName, password, client=cognito, quiet=True)
+            return BatchCredentialResult(user=userName, credentials=exchange_isv_token(sts, sso_oidc, isvToken, rateLimiter))
+        except Exception as e:
+            print(f"Error minting credentials for {userName}: {str(e)}")
+            return BatchCredentialResult(user=userName, error=str(e))
+
+    with ThreadPoolExecutor(max_workers=maxConcurrency, thread_name_prefix="tti-batch") as executor:
+        futures = [executor.submit(mint, userName, password) for userName, password in users]
+        futures += [executor.submit(mint, userName, isvToken=isvToken) for userName, isvToken in isvTokens.items()]
+        return [future.result() for future in futures]
 
 
 
-def get_isv_token(cognito_user_pool_id: str, cognito_client_id: str, cognito_client_secret: str, userName: str, password: str):
+def get_isv_token(cognito_user_pool_id: str, cognito_client_id: str, cognito_client_secret: str, userName: str, password: str, client=None, quiet: bool = False):
     """
     Authenticate against AWS Cognito and retrieve an ID token.
     
@@ -104,12 +202,15 @@ def get_isv_token(cognito_user_pool_id: str, cognito_client_id: str, cognito_cli
         cognito_user_pool_id (str): The Cognito user pool ID
         cognito_client_id (str): The Cognito client ID
         cognito_client_secret (str): The Cognito client secret
+        client: Optional cognito-idp client to reuse across calls
+        quiet (bool): Do not print the progress banner or the token, for batch jobs
     
     Returns:
         str: The ID token from Cognito authentication
     """
     # Prompt for username and password
-    print("\n=== AWS Cognito Authentication ===")
+    if not quiet:
+        print("\n=== AWS Cognito Authentication ===")
 
 
     cognito_username = userName
@@ -125,7 +226,8 @@ def get_isv_token(cognito_user_pool_id: str, cognito_client_id: str, cognito_cli
     
 
 
-    client = boto3.client('cognito-idp', region_name=os.environ.get('ISV_COGNITO_REGION'))
+    if client is None:
+        client = instrument(boto3.client('cognito-idp', region_name=os.environ.get('ISV_COGNITO_REGION')))
 
     # Authenticate against Cognito using ADMIN_USER_PASSWORD_AUTH flow
     try:
@@ -145,11 +247,12 @@ def get_isv_token(cognito_user_pool_id: str, cognito_client_id: str, cognito_cli
         # Extract the ID token
         isv_token = response['AuthenticationResult']['IdToken']
         
-        print("\nReceived ISV token")
-        print("=================")
-        print(isv_token)
-        print("=================")
-        print()
+        if not quiet:
+            print("\nReceived ISV token")
+            print("=================")
+            print(isv_token)
+            print("=================")
+            print()
         
         return isv_token
     